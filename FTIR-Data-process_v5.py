@@ -1,11 +1,27 @@
 import os
 import re
+import json
+import time
+import threading
+import gzip
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, simpledialog
+import numpy as np
 import polars as pl
 import pandas as pd
 from natsort import natsorted
 
+try:
+    import tomllib  # TOML manifests need Python 3.11+
+except ImportError:
+    tomllib = None
+
+try:
+    import zstandard  # Only needed for zstd-compressed output
+except ImportError:
+    zstandard = None
+
 # Global variable initialization
 global_file_path_lv = ""
 global_file_path_cv = ""
@@ -13,6 +29,134 @@ filename_step4 = ""
 df_step4 = None
 canvas = None
 
+# Output settings (changed from the Output Settings section of the GUI)
+global_output_sig_digits = None  # None keeps full float precision
+global_output_compression = "none"
+COMPRESSION_EXTENSIONS = {"gzip": ".gz", "zstd": ".zst"}
+CSV_FILETYPES = [("CSV Files", "*.csv *.csv.gz *.csv.zst")]
+
+# Batch processing: outputs go into a subfolder so a rerun never combines its own results
+BATCH_OUTPUT_DIR = "batch_output"
+MANIFEST_NUMERIC_FIELDS = ["t_eq", "e_begin", "e_vertex1", "e_vertex2", "e_end", "scan_rate"]
+MANIFEST_REQUIRED_FIELDS = {
+    "cv": ["t_eq", "e_begin", "e_vertex1", "e_vertex2", "scan_rate"],
+    "lv": ["t_eq", "e_begin", "e_end", "scan_rate"],
+}
+
+
+# Output writer: significant-digit rounding, Polars' multithreaded CSV writer and optional compression
+def write_csv_output(df, save_path, header_line=None):
+    compression = global_output_compression
+    save_path += COMPRESSION_EXTENSIONS.get(compression, "")
+
+    if isinstance(df, pd.DataFrame):
+        # Pandas allows duplicate headers, Polars does not: write the pandas header ourselves
+        # and work on positional column names. Keep pandas' platform line endings.
+        if header_line is None:
+            header_line = df.iloc[:0].to_csv(index=False)
+        column_names = [str(col) for col in df.columns]
+        df = df.set_axis([str(i) for i in range(len(df.columns))], axis=1)
+        if global_output_sig_digits is not None:
+            df = round_spectral_columns(df, column_names, global_output_sig_digits)
+
+        # Without pyarrow, Polars can only take plain numpy numeric columns; anything else is written by pandas
+        if not all(isinstance(dtype, np.dtype) and dtype.kind in "biuf" for dtype in df.dtypes):
+            with open_output_file(save_path, compression) as f:
+                f.write(header_line.encode('utf-8'))
+                df.to_csv(f, index=False, header=False, mode='wb', encoding='utf-8')
+            return save_path
+
+        df = pl.from_pandas(df)
+        line_terminator = os.linesep
+    else:
+        if global_output_sig_digits is not None:
+            df = round_spectral_columns(df, df.columns, global_output_sig_digits)
+        line_terminator = "\n"
+
+    with open_output_file(save_path, compression) as f:
+        if header_line is not None:
+            f.write(header_line.encode('utf-8'))
+        df.write_csv(f, include_header=header_line is None, line_terminator=line_terminator)
+
+    return save_path
+
+
+# Round every float column except Wavenumber, which is always written at full precision
+def round_spectral_columns(df, column_names, sig_digits):
+    if isinstance(df, pd.DataFrame):
+        df = df.copy()
+        for name, column_name in zip(df.columns, column_names):
+            if column_name == "Wavenumber":
+                if pd.api.types.is_numeric_dtype(df[name]):
+                    check_wavenumber_precision(df[name].to_numpy(dtype=np.float64, na_value=np.nan), sig_digits)
+            elif pd.api.types.is_float_dtype(df[name]):
+                df[name] = round_significant(df[name].to_numpy(dtype=np.float64, na_value=np.nan), sig_digits)
+        return df
+
+    rounded_columns = []
+    for name, column_name in zip(df.columns, column_names):
+        if column_name == "Wavenumber":
+            if df[name].dtype.is_numeric():
+                check_wavenumber_precision(df[name].to_numpy(), sig_digits)
+        elif df[name].dtype.is_float():
+            rounded = round_significant(df[name].to_numpy(), sig_digits)
+            rounded_columns.append(pl.Series(name, rounded, nan_to_null=True))
+    return df.with_columns(rounded_columns)
+
+
+def round_significant(values, sig_digits):
+    values = values.astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        magnitude = np.floor(np.log10(np.abs(values)))
+    magnitude = np.where(np.isfinite(magnitude), magnitude, 0)
+    # Scale by an exact power of ten in either direction to avoid artefacts like 0.30000000000000004
+    exponent = sig_digits - 1 - magnitude
+    power = np.abs(exponent)
+    # Powers beyond 1e300 would overflow to inf; those rare values are rounded exactly through a string instead
+    extreme = power > 300
+    up = (exponent >= 0) & ~extreme
+    down = (exponent < 0) & ~extreme
+    scale = 10.0 ** np.where(extreme, 0, power)
+    rounded = np.empty_like(values)
+    rounded[up] = np.round(values[up] * scale[up]) / scale[up]
+    rounded[down] = np.round(values[down] / scale[down]) * scale[down]
+    rounded[extreme] = [float(f"{value:.{sig_digits - 1}e}") for value in values[extreme]]
+    if np.any(np.isnan(rounded) & ~np.isnan(values)):
+        raise ValueError(f"Rounding to {sig_digits} significant digits produced invalid values.")
+    return rounded
+
+
+# Reject digit counts too coarse to tell neighbouring wavenumbers apart
+def check_wavenumber_precision(wavenumbers, sig_digits):
+    wavenumbers = wavenumbers.astype(np.float64)
+    wavenumbers = wavenumbers[~np.isnan(wavenumbers)]
+    distinct_count = len(np.unique(wavenumbers))
+    if len(np.unique(round_significant(wavenumbers, sig_digits))) == distinct_count:
+        return
+    needed_digits = next((digits for digits in range(sig_digits + 1, 18)
+                          if len(np.unique(round_significant(wavenumbers, digits))) == distinct_count), 17)
+    raise ValueError(f"{sig_digits} significant digits would merge neighbouring wavenumbers; "
+                     f"use at least {needed_digits}.")
+
+
+def open_output_file(save_path, compression):
+    if compression == "gzip":
+        return gzip.open(save_path, 'wb', compresslevel=1)
+    if compression == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd compression requires the 'zstandard' package (pip install zstandard)")
+        return zstandard.ZstdCompressor(level=3, threads=-1).stream_writer(open(save_path, 'wb'))
+    return open(save_path, 'wb')
+
+
+# Strip .csv (and any compression extension) so derived output names stay "<name>_suffix.csv"
+def strip_output_extension(file_path):
+    for extension in COMPRESSION_EXTENSIONS.values():
+        if file_path.lower().endswith(extension):
+            file_path = file_path[:-len(extension)]
+            break
+    return os.path.splitext(file_path)[0]
+
 
 # Step 1: Combine CSV Files with Proper Wavenumber Truncation and Matching
 def combine_csv_files(folder_path):
@@ -61,7 +205,11 @@ def save_as_csv_polars(combined_data, folder_path, default_name_base="combined")
                                              title="Save data",
                                              parent=window)  # Ensure the dialog is always on top
     if save_path:
-        combined_data.write_csv(save_path)
+        try:
+            save_path = write_csv_output(combined_data, save_path)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e), parent=window)
+            return
         messagebox.showinfo("Success", f"Data saved as {save_path}.", parent=window)  # Show success message on top
 
 
@@ -86,7 +234,7 @@ def combine_series_csv_to_xlsx_or_csv():
 # Function to sort spectral columns
 def sort_spectral_columns():
     file_path = filedialog.askopenfilename(title="Select Combined CSV File to Sort",
-                                           filetypes=[("CSV Files", "*.csv")])
+                                           filetypes=CSV_FILETYPES)
     if file_path:
         status_label.config(text="Sorting...", fg="blue")
         window.update_idletasks()  # Ensure the status is updated immediately
@@ -96,11 +244,14 @@ def sort_spectral_columns():
         wavenumber_col = df.pop("Wavenumber")
         sorted_df = df.reindex(sorted(df.columns), axis=1)
         sorted_df.insert(0, "Wavenumber", wavenumber_col)
-        sorted_file_path = os.path.splitext(file_path)[0] + "_sorted.csv"
-        sorted_df.to_csv(sorted_file_path, index=False)
-        messagebox.showinfo("Success", f"Sorted data saved as {sorted_file_path}.",
-                            parent=window)  # Success message on top
-        status_label.config(text="Completed", fg="green")
+        try:
+            sorted_file_path = write_csv_output(sorted_df, strip_output_extension(file_path) + "_sorted.csv")
+            messagebox.showinfo("Success", f"Sorted data saved as {sorted_file_path}.",
+                                parent=window)  # Success message on top
+            status_label.config(text="Completed", fg="green")
+        except ValueError as e:
+            messagebox.showerror("Error", str(e), parent=window)
+            status_label.config(text="Error", fg="red")
         window.update_idletasks()  # Ensure the status is updated immediately
         sort_button.config(state=tk.NORMAL)
 
@@ -157,7 +308,11 @@ def save_as_csv_pandas(combined_data, folder_path, default_name_base="combined")
                                              filetypes=[("CSV files", "*.csv")],
                                              title="Save data")
     if save_path:
-        combined_data.to_csv(save_path, index=False)
+        try:
+            save_path = write_csv_output(combined_data, save_path)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e), parent=window)
+            return
         messagebox.showinfo("Success", f"Data saved as {save_path}.", parent=window)
 
 
@@ -220,9 +375,69 @@ def get_cv_settings():
     tk.Button(settings_frame_cv, text='Save', command=save_cv_settings, bg="green yellow").grid(row=5, column=1, pady=4)
 
 
+# Calculate the CV voltage-range headers for a file with the given number of spectra
+def calculate_cv_column_names(num_spectra_cv, t_eq_cv, e_begin_cv, e_vertex1_cv, e_vertex2_cv, scan_rate_cv):
+    if e_begin_cv == e_vertex2_cv:
+        total_potential_range_cv = abs(e_vertex1_cv - e_begin_cv) + abs(e_begin_cv - e_vertex1_cv)
+    else:
+        total_potential_range_cv = abs(e_vertex1_cv - e_begin_cv) + abs(e_vertex2_cv - e_vertex1_cv) + abs(
+            e_begin_cv - e_vertex2_cv)
+
+    total_time_cv = total_potential_range_cv / scan_rate_cv
+    total_time_cv += t_eq_cv
+    time_interval_per_spectrum_cv = total_time_cv / num_spectra_cv
+    potential_change_per_spectrum_cv = scan_rate_cv * time_interval_per_spectrum_cv
+
+    current_potential_cv = e_begin_cv
+    new_columns_cv = ["Wavenumber"]
+    stage_cv = 1
+    elapsed_time_cv = 0
+
+    def calculate_next_potential(current, target, change):
+        if current < target:
+            next_potential = min(current + change, target)
+        else:
+            next_potential = max(current - change, target)
+        return next_potential
+
+    start_potential_cv = end_potential_cv = current_potential_cv
+
+    for i in range(num_spectra_cv):
+        if elapsed_time_cv < t_eq_cv:
+            start_potential_cv = end_potential_cv = e_begin_cv
+            elapsed_time_cv += time_interval_per_spectrum_cv
+        elif stage_cv == 1:
+            start_potential_cv = current_potential_cv
+            end_potential_cv = calculate_next_potential(current_potential_cv, e_vertex1_cv,
+                                                        potential_change_per_spectrum_cv)
+            if end_potential_cv == e_vertex1_cv:
+                stage_cv = 2
+            current_potential_cv = end_potential_cv
+        elif stage_cv == 2:
+            start_potential_cv = current_potential_cv
+            end_potential_cv = calculate_next_potential(current_potential_cv,
+                                                        e_vertex2_cv if e_begin_cv != e_vertex2_cv else e_begin_cv,
+                                                        potential_change_per_spectrum_cv)
+            if end_potential_cv == e_vertex2_cv or end_potential_cv == e_begin_cv:
+                stage_cv = 3 if e_begin_cv != e_vertex2_cv else 1
+            current_potential_cv = end_potential_cv
+        elif stage_cv == 3:
+            start_potential_cv = current_potential_cv
+            end_potential_cv = calculate_next_potential(current_potential_cv, e_begin_cv,
+                                                        potential_change_per_spectrum_cv)
+            if end_potential_cv == e_begin_cv:
+                stage_cv = 1
+            current_potential_cv = end_potential_cv
+
+        midpoint_cv = (start_potential_cv + end_potential_cv) / 2
+        new_columns_cv.append(f"{midpoint_cv:.2f} V")
+
+    return new_columns_cv
+
+
 def rename_columns_cv():
     global global_file_path_cv
-    global_file_path_cv = filedialog.askopenfilename(title="Select Input File", filetypes=[("CSV Files", "*.csv")])
+    global_file_path_cv = filedialog.askopenfilename(title="Select Input File", filetypes=CSV_FILETYPES)
     if global_file_path_cv:
         status_label.config(text="Renaming Columns...", fg="blue")
         rename_columns_cv_button.config(state=tk.DISABLED)
@@ -236,67 +451,12 @@ def rename_columns_cv():
                                      parent=window)
                 return
 
-            if global_e_begin_cv == global_e_vertex2_cv:
-                total_potential_range_cv = abs(global_e_vertex1_cv - global_e_begin_cv) + abs(
-                    global_e_begin_cv - global_e_vertex1_cv)
-            else:
-                total_potential_range_cv = abs(global_e_vertex1_cv - global_e_begin_cv) + abs(
-                    global_e_vertex2_cv - global_e_vertex1_cv) + abs(global_e_begin_cv - global_e_vertex2_cv)
-
-            total_time_cv = total_potential_range_cv / global_scan_rate_cv
-            total_time_cv += global_t_eq_cv
             num_spectra_cv = len(df.columns) - 1
-            time_interval_per_spectrum_cv = total_time_cv / num_spectra_cv
-            potential_change_per_spectrum_cv = global_scan_rate_cv * time_interval_per_spectrum_cv
-
-            current_potential_cv = global_e_begin_cv
-            new_columns_cv = ["Wavenumber"]
-            stage_cv = 1
-            elapsed_time_cv = 0
-
-            def calculate_next_potential(current, target, change):
-                if current < target:
-                    next_potential = min(current + change, target)
-                else:
-                    next_potential = max(current - change, target)
-                return next_potential
-
-            start_potential_cv = end_potential_cv = current_potential_cv
-
-            for i in range(1, len(df.columns)):
-                if elapsed_time_cv < global_t_eq_cv:
-                    start_potential_cv = end_potential_cv = global_e_begin_cv
-                    elapsed_time_cv += time_interval_per_spectrum_cv
-                elif stage_cv == 1:
-                    start_potential_cv = current_potential_cv
-                    end_potential_cv = calculate_next_potential(current_potential_cv, global_e_vertex1_cv,
-                                                                potential_change_per_spectrum_cv)
-                    if end_potential_cv == global_e_vertex1_cv:
-                        stage_cv = 2
-                    current_potential_cv = end_potential_cv
-                elif stage_cv == 2:
-                    start_potential_cv = current_potential_cv
-                    end_potential_cv = calculate_next_potential(current_potential_cv,
-                                                                global_e_vertex2_cv if global_e_begin_cv != global_e_vertex2_cv else global_e_begin_cv,
-                                                                potential_change_per_spectrum_cv)
-                    if end_potential_cv == global_e_vertex2_cv or end_potential_cv == global_e_begin_cv:
-                        stage_cv = 3 if global_e_begin_cv != global_e_vertex2_cv else 1
-                    current_potential_cv = end_potential_cv
-                elif stage_cv == 3:
-                    start_potential_cv = current_potential_cv
-                    end_potential_cv = calculate_next_potential(current_potential_cv, global_e_begin_cv,
-                                                                potential_change_per_spectrum_cv)
-                    if end_potential_cv == global_e_begin_cv:
-                        stage_cv = 1
-                    current_potential_cv = end_potential_cv
-
-                midpoint_cv = (start_potential_cv + end_potential_cv) / 2
-                new_columns_cv.append(f"{midpoint_cv:.2f} V")
-
+            new_columns_cv = calculate_cv_column_names(num_spectra_cv, global_t_eq_cv, global_e_begin_cv,
+                                                       global_e_vertex1_cv, global_e_vertex2_cv, global_scan_rate_cv)
             df.columns = new_columns_cv
 
-            save_path_cv = os.path.splitext(global_file_path_cv)[0] + "_renamed_cv.csv"
-            df.to_csv(save_path_cv, index=False)
+            save_path_cv = write_csv_output(df, strip_output_extension(global_file_path_cv) + "_renamed_cv.csv")
             messagebox.showinfo("Success", f"Data saved as {save_path_cv}.", parent=window)
             status_label.config(text="Completed", fg="green")
         except Exception as e:
@@ -353,9 +513,36 @@ def get_lv_settings():
     tk.Button(settings_frame_lv, text='Save', command=save_lv_settings, bg="green yellow").grid(row=4, column=1, pady=4)
 
 
+# Calculate the LV voltage-range headers for a file with the given number of spectra
+def calculate_lv_column_names(num_spectra_lv, t_eq_lv, e_begin_lv, e_end_lv, scan_rate_lv):
+    total_potential_range_lv = abs(e_end_lv - e_begin_lv)
+    total_time_lv = total_potential_range_lv / scan_rate_lv
+    total_time_lv += t_eq_lv
+    time_interval_per_spectrum_lv = total_time_lv / num_spectra_lv
+    potential_change_per_spectrum_lv = scan_rate_lv * time_interval_per_spectrum_lv
+
+    current_potential_lv = e_begin_lv
+    new_columns_lv = ["Wavenumber"]
+    elapsed_time_lv = 0
+
+    for i in range(num_spectra_lv):
+        if elapsed_time_lv < t_eq_lv:
+            start_potential_lv = end_potential_lv = e_begin_lv
+            elapsed_time_lv += time_interval_per_spectrum_lv
+        else:
+            start_potential_lv = current_potential_lv
+            end_potential_lv = start_potential_lv + potential_change_per_spectrum_lv if e_begin_lv < e_end_lv else start_potential_lv - potential_change_per_spectrum_lv
+            current_potential_lv = end_potential_lv
+
+        midpoint_lv = (start_potential_lv + end_potential_lv) / 2
+        new_columns_lv.append(f"{midpoint_lv:.2f} V")
+
+    return new_columns_lv
+
+
 def rename_columns_lv():
     global global_file_path_lv
-    global_file_path_lv = filedialog.askopenfilename(title="Select Input File", filetypes=[("CSV Files", "*.csv")])
+    global_file_path_lv = filedialog.askopenfilename(title="Select Input File", filetypes=CSV_FILETYPES)
     if global_file_path_lv:
         status_label.config(text="Renaming Columns...", fg="blue")
         rename_columns_lv_button.config(state=tk.DISABLED)
@@ -367,33 +554,12 @@ def rename_columns_lv():
                 messagebox.showerror("Input Error", "E_begin must not be equal to E_end", parent=window)
                 return
 
-            total_potential_range_lv = abs(global_e_end_lv - global_e_begin_lv)
-            total_time_lv = total_potential_range_lv / global_scan_rate_lv
-            total_time_lv += global_t_eq_lv
             num_spectra_lv = len(df.columns) - 1
-            time_interval_per_spectrum_lv = total_time_lv / num_spectra_lv
-            potential_change_per_spectrum_lv = global_scan_rate_lv * time_interval_per_spectrum_lv
-
-            current_potential_lv = global_e_begin_lv
-            new_columns_lv = ["Wavenumber"]
-            elapsed_time_lv = 0
-
-            for i in range(1, len(df.columns)):
-                if elapsed_time_lv < global_t_eq_lv:
-                    start_potential_lv = end_potential_lv = global_e_begin_lv
-                    elapsed_time_lv += time_interval_per_spectrum_lv
-                else:
-                    start_potential_lv = current_potential_lv
-                    end_potential_lv = start_potential_lv + potential_change_per_spectrum_lv if global_e_begin_lv < global_e_end_lv else start_potential_lv - potential_change_per_spectrum_lv
-                    current_potential_lv = end_potential_lv
-
-                midpoint_lv = (start_potential_lv + end_potential_lv) / 2
-                new_columns_lv.append(f"{midpoint_lv:.2f} V")
-
+            new_columns_lv = calculate_lv_column_names(num_spectra_lv, global_t_eq_lv, global_e_begin_lv,
+                                                       global_e_end_lv, global_scan_rate_lv)
             df.columns = new_columns_lv
 
-            save_path_lv = os.path.splitext(global_file_path_lv)[0] + "_renamed_lv.csv"
-            df.to_csv(save_path_lv, index=False)
+            save_path_lv = write_csv_output(df, strip_output_extension(global_file_path_lv) + "_renamed_lv.csv")
             messagebox.showinfo("Success", f"Data saved as {save_path_lv}.", parent=window)
             status_label.config(text="Completed", fg="green")
         except Exception as e:
@@ -405,7 +571,7 @@ def rename_columns_lv():
 
 def rename_headers_based_on_time():
     global filename_step1
-    filename_step1 = filedialog.askopenfilename(title="Select CSV File for Step 1", filetypes=[("CSV Files", "*.csv")])
+    filename_step1 = filedialog.askopenfilename(title="Select CSV File for Step 1", filetypes=CSV_FILETYPES)
     if filename_step1:
         status_label.config(text="Renaming Headers...", fg="blue")
         rename_time_button.config(state=tk.DISABLED)
@@ -420,8 +586,12 @@ def rename_headers_based_on_time():
             new_headers = ['Wavenumber'] + [f"{i * time_interval:.2f}s" for i in range(num_columns)]
             df_step1.columns = new_headers
 
-            renamed_filename = os.path.splitext(filename_step1)[0] + "_renamed.csv"
-            df_step1.to_csv(renamed_filename, index=False)
+            try:
+                renamed_filename = write_csv_output(df_step1, strip_output_extension(filename_step1) + "_renamed.csv")
+            except ValueError as e:
+                messagebox.showerror("Error", str(e), parent=window)
+                status_label.config(text="Error", fg="red")
+                return
             messagebox.showinfo("Headers Renamed and Saved",
                                 f"Headers have been renamed and saved to {renamed_filename}.", parent=window)
             status_label.config(text="Completed", fg="green")
@@ -435,7 +605,7 @@ def rename_headers_based_on_time():
 # Step 3: Reprocessing background using one of the columns in the file
 def bg_processing():
     file_path = filedialog.askopenfilename(title="Select Input File",
-                                           filetypes=[("Excel and CSV Files", "*.xlsx *.csv")])
+                                           filetypes=[("Excel and CSV Files", "*.xlsx *.csv *.csv.gz *.csv.zst")])
 
     if not file_path:
         return
@@ -450,7 +620,7 @@ def bg_processing():
         file_extension = os.path.splitext(file_path)[1].lower()
         if file_extension == '.xlsx':
             df = pd.read_excel(file_path)
-        elif file_extension == '.csv':
+        elif file_path.lower().endswith(('.csv', '.csv.gz', '.csv.zst')):
             df = pd.read_csv(file_path)
         else:
             messagebox.showerror("Error", "Unsupported file format.", parent=window)
@@ -480,7 +650,13 @@ def bg_processing():
                 return
 
             column_window.destroy()
-            process_and_save(chosen_column, file_path, df)
+            try:
+                process_and_save(chosen_column, file_path, df)
+            except ValueError as e:
+                messagebox.showerror("Error", str(e), parent=window)
+                status_label.config(text="Error", fg="red")
+                process_background_data_button.config(state=tk.NORMAL)
+                return
 
             # Update status and re-enable button after successful processing
             status_label.config(text="Completed", fg="green")
@@ -502,6 +678,13 @@ def bg_processing():
 
 
 def process_and_save(chosen_column, file_path, df):
+    save_path = subtract_background(chosen_column, file_path, df)
+    messagebox.showinfo("Success", f"File successfully saved as {save_path}", parent=window)
+    status_label.config(text="Idle", fg="green")  # Update status to "Idle" after saving
+
+
+# Subtract the chosen background column from every spectrum and save next to the input file
+def subtract_background(chosen_column, file_path, df):
     processed_sheet = pd.DataFrame()
     processed_sheet["Wavenumber"] = df["Wavenumber"]
 
@@ -511,14 +694,305 @@ def process_and_save(chosen_column, file_path, df):
         else:
             processed_sheet[column] = df[column] - df[chosen_column]
 
-    save_path = os.path.splitext(file_path)[0] + f"_{chosen_column}.csv"
-    with open(save_path, 'w', newline='', encoding='utf-8') as f:
-        # Write headers exactly as they appear in the original DataFrame
-        f.write(','.join(df.columns) + '\n')
-        processed_sheet.to_csv(f, index=False, header=False)
+    # Write headers exactly as they appear in the original DataFrame
+    save_path = strip_output_extension(file_path) + f"_{chosen_column}.csv"
+    return write_csv_output(processed_sheet, save_path, header_line=','.join(df.columns) + '\n')
+
+
+# Step 4: Batch processing of many experiment folders from a parameter manifest
+def load_manifest(manifest_path):
+    file_extension = os.path.splitext(manifest_path)[1].lower()
+    if file_extension == '.csv':
+        rows = pd.read_csv(manifest_path, dtype=str, keep_default_na=False).to_dict("records")
+    elif file_extension == '.json':
+        with open(manifest_path, encoding='utf-8') as f:
+            data = json.load(f)
+        rows = data.get("jobs", []) if isinstance(data, dict) else data
+    elif file_extension == '.toml':
+        if tomllib is None:
+            raise ValueError("TOML manifests require Python 3.11 or newer")
+        with open(manifest_path, 'rb') as f:
+            rows = tomllib.load(f).get("jobs", [])
+    else:
+        raise ValueError("Unsupported manifest format")
+
+    # Relative folders in the manifest are resolved against the manifest location
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+    jobs = []
+    seen_folders = set()
+    for row_number, row in enumerate(rows, start=1):
+        job = parse_manifest_row(row, manifest_dir, row_number)
+        if job["folder"] in seen_folders:
+            raise ValueError(f"Manifest row {row_number}: folder {job['folder']} is listed more than once")
+        seen_folders.add(job["folder"])
+        jobs.append(job)
+
+    if not jobs:
+        raise ValueError("No jobs found in the manifest.")
+    return jobs
+
+
+def parse_manifest_row(row, manifest_dir, row_number):
+    folder = str(row.get("folder") or "").strip()
+    if not folder:
+        raise ValueError(f"Manifest row {row_number}: missing folder")
+
+    mode = str(row.get("mode") or "").strip().lower()
+    if mode not in ("", "cv", "lv"):
+        raise ValueError(f"Manifest row {row_number}: mode must be 'cv', 'lv' or empty")
+
+    job = {"folder": os.path.normpath(os.path.join(manifest_dir, folder)), "mode": mode}
+    for field in MANIFEST_NUMERIC_FIELDS:
+        value = row.get(field)
+        if value is None or str(value).strip() == "":
+            job[field] = None
+            continue
+        try:
+            job[field] = float(value)
+        except ValueError:
+            raise ValueError(f"Manifest row {row_number}: {field} must be numeric")
+
+    missing_fields = [field for field in MANIFEST_REQUIRED_FIELDS.get(mode, []) if job[field] is None]
+    if missing_fields:
+        raise ValueError(f"Manifest row {row_number}: missing {', '.join(missing_fields)} for {mode.upper()}")
+
+    if mode == "cv" and not (min(job["e_vertex1"], job["e_vertex2"]) <= job["e_begin"] <= max(job["e_vertex1"],
+                                                                                             job["e_vertex2"])):
+        raise ValueError(f"Manifest row {row_number}: E_begin must be equal or between E_vertex1 and E_vertex2")
+    if mode == "lv" and job["e_begin"] == job["e_end"]:
+        raise ValueError(f"Manifest row {row_number}: E_begin must not be equal to E_end")
+
+    job["background"] = str(row.get("background") or "").strip()
+    return job
+
+
+# Size and modification time of every input spectrum, so a rerun notices files added or changed since
+def list_input_files(folder_path):
+    input_files = {}
+    for csv_file in os.listdir(folder_path):
+        if csv_file.lower().endswith('.csv'):
+            file_stat = os.stat(os.path.join(folder_path, csv_file))
+            input_files[csv_file] = [file_stat.st_size, file_stat.st_mtime_ns]
+    return input_files
+
+
+# Run Steps 1-3 for a single folder, reading each step's output back like the manual workflow does
+def run_batch_job(job):
+    folder = job["folder"]
+    if not os.path.isdir(folder):
+        raise ValueError(f"Folder not found: {folder}")
+
+    # Taken before combining, so spectra arriving mid-run make the next run process the folder again
+    input_files = list_input_files(folder)
+    combined_data = combine_csv_files(folder)
+    if isinstance(combined_data, str):
+        raise ValueError(combined_data)
+    output_dir = os.path.join(folder, BATCH_OUTPUT_DIR)
+    os.makedirs(output_dir, exist_ok=True)
+    current_path = write_csv_output(combined_data, os.path.join(output_dir, "combined.csv"))
+    outputs = [current_path]
+
+    if job["mode"]:
+        df = pd.read_csv(current_path)
+        num_spectra = len(df.columns) - 1
+        if job["mode"] == "cv":
+            df.columns = calculate_cv_column_names(num_spectra, job["t_eq"], job["e_begin"], job["e_vertex1"],
+                                                   job["e_vertex2"], job["scan_rate"])
+        else:
+            df.columns = calculate_lv_column_names(num_spectra, job["t_eq"], job["e_begin"], job["e_end"],
+                                                   job["scan_rate"])
+        current_path = write_csv_output(df, strip_output_extension(current_path) + f"_renamed_{job['mode']}.csv")
+        outputs.append(current_path)
+
+    if job["background"]:
+        df = pd.read_csv(current_path)
+        if job["background"] not in df.columns:
+            raise ValueError(f"Background column '{job['background']}' not found in {current_path}")
+        outputs.append(subtract_background(job["background"], current_path, df))
+
+    return {"spectra": len(combined_data.columns) - 1, "inputs": input_files, "outputs": outputs}
+
+
+def load_checkpoint(checkpoint_path):
+    if not os.path.exists(checkpoint_path):
+        return {}
+    with open(checkpoint_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_checkpoint(checkpoint_path, checkpoint):
+    # Write to a temporary file first so a crash never leaves a half-written checkpoint behind
+    temp_path = checkpoint_path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(temp_path, checkpoint_path)
+
+
+# Run all jobs on a bounded worker pool, skipping folders the checkpoint already marks as done
+def run_batch(jobs, checkpoint_path, max_workers, progress_callback=None):
+    checkpoint = load_checkpoint(checkpoint_path)
+    summary = {"total": len(jobs), "completed": 0, "skipped": 0, "failed": [], "spectra": 0, "elapsed": 0.0}
+
+    # A folder is only skipped if it finished with exactly the same parameters, input spectra and
+    # output settings, and all of its output files are still on disk
+    output_settings = {"sig_digits": global_output_sig_digits, "compression": global_output_compression}
+    pending_jobs = []
+    for job in jobs:
+        entry = checkpoint.get(job["folder"])
+        if (entry and entry["status"] == "done" and entry["job"] == job
+                and os.path.isdir(job["folder"]) and entry.get("inputs") == list_input_files(job["folder"])
+                and entry.get("output_settings") == output_settings
+                and all(os.path.exists(path) for path in entry["outputs"])):
+            summary["skipped"] += 1
+        else:
+            pending_jobs.append(job)
+
+    if progress_callback:
+        progress_callback(summary["skipped"], summary["total"])
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(run_batch_job, job): job for job in pending_jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                result = future.result()
+                checkpoint[job["folder"]] = {"status": "done", "job": job, "inputs": result["inputs"],
+                                             "output_settings": output_settings, "outputs": result["outputs"]}
+                summary["completed"] += 1
+                summary["spectra"] += result["spectra"]
+            except Exception as e:
+                checkpoint[job["folder"]] = {"status": "failed", "job": job, "error": str(e)}
+                summary["failed"].append((job["folder"], str(e)))
+            save_checkpoint(checkpoint_path, checkpoint)
+
+            if progress_callback:
+                finished = summary["skipped"] + summary["completed"] + len(summary["failed"])
+                progress_callback(finished, summary["total"])
+
+    summary["elapsed"] = time.perf_counter() - start_time
+    return summary
+
+
+def format_batch_summary(summary):
+    elapsed = summary["elapsed"]
+    processed = summary["completed"] + len(summary["failed"])
+    folders_per_minute = processed / elapsed * 60 if elapsed > 0 else 0.0
+    spectra_per_second = summary["spectra"] / elapsed if elapsed > 0 else 0.0
+
+    lines = [
+        f"Folders in manifest: {summary['total']}",
+        f"Completed: {summary['completed']}",
+        f"Skipped (already done): {summary['skipped']}",
+        f"Failed: {len(summary['failed'])}",
+        f"Elapsed time: {elapsed:.1f} s",
+        f"Throughput: {folders_per_minute:.2f} folders/min, {spectra_per_second:.1f} spectra/s",
+    ]
+    for folder, error in summary["failed"]:
+        lines.append(f"FAILED {folder}: {error}")
+    return "\n".join(lines)
+
+
+def batch_process_manifest():
+    manifest_path = filedialog.askopenfilename(title="Select Parameter Manifest",
+                                               filetypes=[("Manifest Files", "*.csv *.json *.toml")])
+    if not manifest_path:
+        return
+
+    max_workers = simpledialog.askinteger("Input", "Number of folders to process in parallel:",
+                                          initialvalue=min(4, os.cpu_count() or 1), minvalue=1, parent=window)
+    if max_workers is None:
+        return
 
-    messagebox.showinfo("Success", f"File successfully saved as {save_path}", parent=window)
-    status_label.config(text="Idle", fg="green")  # Update status to "Idle" after saving
+    try:
+        jobs = load_manifest(manifest_path)
+    except Exception as e:
+        messagebox.showerror("Error", str(e), parent=window)
+        return
+
+    status_label.config(text="Batch Processing...", fg="blue")
+    batch_process_button.config(state=tk.DISABLED)
+    checkpoint_path = os.path.splitext(manifest_path)[0] + "_checkpoint.json"
+    summary_path = os.path.splitext(manifest_path)[0] + "_summary.txt"
+
+    def show_progress(finished, total):
+        status_label.config(text=f"Batch Processing... {finished}/{total}", fg="blue")
+
+    def show_summary(summary):
+        try:
+            summary_text = format_batch_summary(summary)
+            with open(summary_path, 'w', encoding='utf-8') as f:
+                f.write(summary_text + "\n")
+
+            if summary["failed"]:
+                messagebox.showwarning("Batch Completed with Errors",
+                                       f"{summary_text}\n\nSummary saved as {summary_path}.", parent=window)
+                status_label.config(text="Completed with Errors", fg="red")
+            else:
+                messagebox.showinfo("Batch Completed", f"{summary_text}\n\nSummary saved as {summary_path}.",
+                                    parent=window)
+                status_label.config(text="Completed", fg="green")
+        except Exception as e:
+            show_error(e)
+        finally:
+            batch_process_button.config(state=tk.NORMAL)
+
+    def show_error(e):
+        messagebox.showerror("Error", str(e), parent=window)
+        status_label.config(text="Error", fg="red")
+        batch_process_button.config(state=tk.NORMAL)
+
+    # The batch runs on a background thread so the window stays responsive; GUI updates go through window.after
+    def run_in_background():
+        try:
+            summary = run_batch(jobs, checkpoint_path, max_workers,
+                                lambda finished, total: window.after(0, show_progress, finished, total))
+            window.after(0, show_summary, summary)
+        except Exception as e:
+            window.after(0, show_error, e)
+
+    threading.Thread(target=run_in_background, daemon=True).start()
+
+
+# Output settings: precision and compression
+def get_output_settings():
+    global sig_digits_entry_output, compression_combobox_output
+
+    def save_output_settings():
+        global global_output_sig_digits, global_output_compression
+        try:
+            sig_digits = sig_digits_entry_output.get().strip()
+            sig_digits = int(sig_digits) if sig_digits else None
+            compression = compression_combobox_output.get()
+
+            if sig_digits is not None and not 1 <= sig_digits <= 17:
+                messagebox.showerror("Input Error", "Significant digits must be between 1 and 17", parent=window)
+                return
+            if compression == "zstd" and zstandard is None:
+                messagebox.showerror("Input Error", "zstd compression requires the 'zstandard' package",
+                                     parent=window)
+                return
+
+            global_output_sig_digits = sig_digits
+            global_output_compression = compression
+            output_settings_label.config(text=f"Output: {sig_digits or 'full'} digits, {compression}")
+
+        except ValueError:
+            messagebox.showerror("Input Error", "Please enter a valid integer value.", parent=window)
+
+    tk.Label(settings_frame_output, text="Significant digits (blank = full):").grid(row=0, column=0)
+    tk.Label(settings_frame_output, text="Compression:").grid(row=1, column=0)
+
+    sig_digits_entry_output = tk.Entry(settings_frame_output)
+    compression_combobox_output = ttk.Combobox(settings_frame_output, values=["none", "gzip", "zstd"],
+                                               state="readonly", width=17)
+    compression_combobox_output.set(global_output_compression)
+
+    sig_digits_entry_output.grid(row=0, column=1)
+    compression_combobox_output.grid(row=1, column=1)
+
+    tk.Button(settings_frame_output, text='Save', command=save_output_settings,
+              bg="green yellow").grid(row=2, column=1, pady=4)
 
 
 root = tk.Tk()
@@ -673,6 +1147,26 @@ process_background_data_button = tk.Button(right_frame, text="Reprocess Backgrou
                                            bg="sky blue")
 process_background_data_button.pack(pady=5, anchor="w")
 
+# Step 4 Section
+label_step3 = tk.Label(right_frame, text="Step 4: Batch Process Folders", font=("Helvetica", 12, "bold"))
+label_step3.pack(pady=10, anchor="w")
+
+batch_process_button = tk.Button(right_frame, text="Run Batch from Manifest", command=batch_process_manifest,
+                                 bg="sky blue")
+batch_process_button.pack(pady=5, anchor="w")
+
+# Output Settings Section
+label_output = tk.Label(right_frame, text="Output Settings", font=("Helvetica", 12, "bold"))
+label_output.pack(pady=10, anchor="w")
+
+settings_frame_output = tk.Frame(right_frame, padx=10, pady=10)
+settings_frame_output.pack(anchor="w")
+
+get_output_settings()
+
+output_settings_label = tk.Label(right_frame, text="Output: full digits, none", bg="lemon chiffon")
+output_settings_label.pack(anchor="w")
+
 # Exit Section
 exit_button = tk.Button(scrollable_frame, text="Exit Application", command=exit_application, bg="tomato")
 exit_button.grid(row=2, column=0, columnspan=2, pady=10, sticky="ew")